@@ -0,0 +1,59 @@
+import argparse
+import json
+import sys
+
+from app.db import SessionLocal
+from app.agreement import (
+    AgreementSummary,
+    DEFAULT_TOP_N,
+    build_agreement_report,
+    chunk_records,
+    iter_agreement_chunks
+)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Fleet-wide rule vs ML agreement report"
+    )
+    parser.add_argument("--ids", type=int, nargs="*", help="limit to these worker ids")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_N, help="worst disagreements to report")
+    parser.add_argument("--records", action="store_true", help="also print one JSON line per worker")
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        help="shard scoring across this many processes (summary only, not with --records)"
+    )
+    args = parser.parse_args()
+
+    if args.processes > 1 and args.records:
+        parser.error("--records streams per-worker lines in-process and cannot be combined with --processes")
+
+    db = SessionLocal()
+
+    try:
+        if args.processes > 1:
+            summary = build_agreement_report(db, args.ids, args.top, args.processes)
+            print(json.dumps({"summary": summary}, indent=2))
+            return
+
+        summary = AgreementSummary(args.top)
+
+        for chunk in iter_agreement_chunks(db, args.ids):
+            summary.add(chunk)
+
+            if args.records:
+                for record in chunk_records(chunk):
+                    sys.stdout.write(json.dumps(record) + "\n")
+
+        print(json.dumps({"summary": summary.result()}, indent=None if args.records else 2))
+
+    finally:
+        db.close()
+
+
+# Guarded so sharded runs can spawn worker processes
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# app/agreement.py
+
+import heapq
+
+import numpy as np
+
+from app.analytics import clamp_score
+from app.db import SessionLocal
+from app.ml_model import fleet_query, predict_workers
+from app.sharding import map_shards
+
+AGREEMENT_CHUNK_SIZE = 5000
+
+# ML and rule scores both live on 1–10, so differences fall in [-9, 9]
+MAX_DIFFERENCE = 9
+
+# |ml - rule| at or below this counts as agreement in the summary
+AGREEMENT_TOLERANCE = 1.0
+
+DEFAULT_TOP_N = 10
+
+
+# -----------------------------
+# AGREEMENT FORMULA
+# -----------------------------
+def round2(values):
+    """
+    Element-wise round(value, 2), matching Python's round exactly (as
+    /compare does). np.round differs for values within float error of a
+    half-cent, so only those go through Python's round.
+    """
+
+    values = np.array(values, dtype=float, ndmin=1)
+    scaled = values * 100
+
+    rounded = np.rint(scaled) / 100
+
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[near_tie] = [round(value, 2) for value in values[near_tie].tolist()]
+
+    return rounded
+
+
+def agreement_confidence(difference, jobs_completed):
+    """
+    Confidence in a rule-vs-ML comparison: half from how closely the
+    two scores agree, half from how much job history backs them.
+    Works on scalars and numpy arrays alike (always returns an array).
+    """
+
+    jobs_factor = np.minimum(np.asarray(jobs_completed, dtype=float) / 50, 1)
+    agreement_score = np.maximum(0, 1 - (np.abs(difference) / 10))
+
+    return round2(0.5 * agreement_score + 0.5 * jobs_factor)
+
+
+# -----------------------------
+# QUERY
+# -----------------------------
+def agreement_query(worker_ids=None, id_range=None, chunk_size=AGREEMENT_CHUNK_SIZE):
+    return fleet_query(worker_ids, id_range=id_range, chunk_size=chunk_size)
+
+
+# -----------------------------
+# VECTORIZED SCORING
+# -----------------------------
+def agreement_chunk(worker_ids, rule_scores, predicted_quality, ml_confidence, jobs_completed):
+    """
+    Rule score, ML score, difference and confidence as aligned numpy arrays.
+    """
+
+    ml_scores = round2(predicted_quality * 10)
+    difference = round2(ml_scores - rule_scores)
+
+    return {
+        "worker_id": worker_ids,
+        "rule_score": rule_scores,
+        "ml_score": ml_scores,
+        "ml_confidence": ml_confidence,
+        "difference": difference,
+        "confidence": agreement_confidence(difference, jobs_completed)
+    }
+
+
+def score_chunk(rows, model=None):
+
+    predicted_quality, ml_confidence = predict_workers(rows, model)
+
+    return agreement_chunk(
+        np.array([row.id for row in rows], dtype=int),
+        clamp_score(np.array([row.rule_score for row in rows], dtype=float)),
+        predicted_quality,
+        ml_confidence,
+        np.array([row.jobs_completed or 0 for row in rows], dtype=float)
+    )
+
+
+def iter_agreement_chunks(
+    db,
+    worker_ids=None,
+    id_range=None,
+    model=None,
+    chunk_size=AGREEMENT_CHUNK_SIZE
+):
+
+    result = db.execute(agreement_query(worker_ids, id_range, chunk_size))
+
+    for rows in result.partitions():
+        yield score_chunk(rows, model)
+
+
+def chunk_records(chunk, indices=None):
+
+    if indices is None:
+        indices = range(len(chunk["worker_id"]))
+
+    for i in indices:
+        yield {
+            "worker_id": int(chunk["worker_id"][i]),
+            "rule_score": int(chunk["rule_score"][i]),
+            "ml_score": float(chunk["ml_score"][i]),
+            "ml_confidence": float(chunk["ml_confidence"][i]),
+            "difference": float(chunk["difference"][i]),
+            "confidence": float(chunk["confidence"][i])
+        }
+
+
+# -----------------------------
+# SUMMARY
+# -----------------------------
+class AgreementSummary:
+    """
+    Running summary over scored chunks, so the fleet never has to be
+    held in memory at once.
+    """
+
+    def __init__(self, top_n=DEFAULT_TOP_N):
+        self.top_n = top_n
+        self.count = 0
+        self.agreeing = 0
+        self.sum_difference = 0.0
+        self.sum_abs_difference = 0.0
+        self.sum_sq_difference = 0.0
+        self.sum_confidence = 0.0
+        self.max_abs_difference = 0.0
+        self.histogram = np.zeros(2 * MAX_DIFFERENCE + 1, dtype=int)
+        self.worst = []
+
+    def add(self, chunk):
+
+        difference = chunk["difference"]
+
+        if len(difference) == 0:
+            return
+
+        abs_difference = np.abs(difference)
+
+        self.count += len(difference)
+        self.agreeing += int(np.count_nonzero(abs_difference <= AGREEMENT_TOLERANCE))
+        self.sum_difference += float(difference.sum())
+        self.sum_abs_difference += float(abs_difference.sum())
+        self.sum_sq_difference += float(np.square(difference).sum())
+        self.sum_confidence += float(chunk["confidence"].sum())
+        self.max_abs_difference = max(self.max_abs_difference, float(abs_difference.max()))
+
+        buckets = np.clip(np.rint(difference), -MAX_DIFFERENCE, MAX_DIFFERENCE).astype(int)
+        self.histogram += np.bincount(
+            buckets + MAX_DIFFERENCE,
+            minlength=len(self.histogram)
+        )
+
+        if self.top_n > 0:
+            # largest |difference| first, ties broken by lowest worker id,
+            # so the result does not depend on how the fleet was chunked
+            order = np.lexsort((chunk["worker_id"], -abs_difference))
+            self._keep_worst(chunk_records(chunk, order[:self.top_n]))
+
+    def _keep_worst(self, records):
+
+        self.worst = heapq.nsmallest(
+            self.top_n,
+            self.worst + list(records),
+            key=lambda record: (-abs(record["difference"]), record["worker_id"])
+        )
+
+    def merge(self, other):
+        """
+        Folds in a summary built over a disjoint set of workers (a shard).
+        """
+
+        self.count += other.count
+        self.agreeing += other.agreeing
+        self.sum_difference += other.sum_difference
+        self.sum_abs_difference += other.sum_abs_difference
+        self.sum_sq_difference += other.sum_sq_difference
+        self.sum_confidence += other.sum_confidence
+        self.max_abs_difference = max(self.max_abs_difference, other.max_abs_difference)
+        self.histogram += other.histogram
+
+        if self.top_n > 0:
+            self._keep_worst(other.worst)
+
+    def result(self):
+
+        count = max(self.count, 1)
+        mean_difference = self.sum_difference / count
+        variance = max(self.sum_sq_difference / count - mean_difference ** 2, 0)
+
+        return {
+            "workers": self.count,
+            "mean_difference": round(mean_difference, 4),
+            "mean_abs_difference": round(self.sum_abs_difference / count, 4),
+            "std_difference": round(variance ** 0.5, 4),
+            "max_abs_difference": round(self.max_abs_difference, 2),
+            "agreement_rate": round(self.agreeing / count, 4),
+            "mean_confidence": round(self.sum_confidence / count, 4),
+            "difference_histogram": {
+                str(bucket): int(self.histogram[bucket + MAX_DIFFERENCE])
+                for bucket in range(-MAX_DIFFERENCE, MAX_DIFFERENCE + 1)
+            },
+            "worst_disagreements": self.worst
+        }
+
+
+def agreement_shard(model, id_range, worker_ids=None, top_n=DEFAULT_TOP_N):
+    """
+    Shard task (see app.sharding.map_shards): scores one id range in the
+    worker process and returns its partial summary.
+    """
+
+    db = SessionLocal()
+
+    try:
+        summary = AgreementSummary(top_n)
+
+        for chunk in iter_agreement_chunks(db, worker_ids, id_range, model):
+            summary.add(chunk)
+
+        return summary
+    finally:
+        db.close()
+
+
+def build_agreement_report(db, worker_ids=None, top_n=DEFAULT_TOP_N, processes=None):
+
+    summary = AgreementSummary(top_n)
+
+    for partial in map_shards(
+        agreement_shard,
+        db,
+        worker_ids,
+        top_n,
+        worker_ids=worker_ids,
+        processes=processes
+    ):
+        summary.merge(partial)
+
+    return summary.result()
@@ -1,5 +1,91 @@
 # app/analytics.py
 
+import numpy as np
+from sqlalchemy import case, func
+
+HIGH_DEMAND_SKILLS = ["delivery", "cleaning", "driver"]
+
+MIN_SCORE = 1
+MAX_SCORE = 10
+
+# Rule definitions shared by the Python scorer and the SQL expression.
+# Each entry is (field, tiers); tiers are checked in order and the first
+# match wins. A tier is (op, threshold, points, reason), op=None is "else".
+EMPLOYABILITY_RULES = [
+    # ---- EXPERIENCE ----
+    ("experience_years", [
+        (">=", 5, 3, "Strong experience (5+ years)"),
+        (">=", 2, 2, "Moderate experience (2+ years)"),
+        (None, None, 1, "Limited experience"),
+    ]),
+
+    # ---- SKILL DEMAND ----
+    ("skill", [
+        ("in", HIGH_DEMAND_SKILLS, 1, "High-demand skill"),
+    ]),
+
+    # ---- PERFORMANCE METRICS ----
+    ("rating", [
+        (">=", 4.5, 2, "Excellent rating"),
+        (">=", 3.5, 1, "Good rating"),
+    ]),
+    ("on_time", [
+        (">=", 90, 1, "High punctuality"),
+    ]),
+    ("completion", [
+        (">=", 90, 1, "High completion rate"),
+    ]),
+
+    # ---- COMPLAINT PENALTY ----
+    ("complaints", [
+        (">=", 20, -2, "High complaint history"),
+        (">=", 5, -1, "Some complaints reported"),
+    ]),
+
+    # ---- JOB VOLUME ----
+    ("jobs_completed", [
+        (">=", 100, 1, "Strong work history"),
+    ]),
+
+    # ---- SALARY FACTOR ----
+    ("salary", [
+        ("<=", 20000, 1, "Cost-effective salary"),
+    ]),
+]
+
+
+# -----------------------------
+# RULE MATCHING
+# -----------------------------
+def _matches(op, value, threshold):
+
+    if op is None:
+        return True
+    if op == ">=":
+        return value >= threshold
+    if op == "<=":
+        return value <= threshold
+    if op == "in":
+        return value.lower() in threshold
+
+    raise ValueError(f"Unknown rule operator: {op}")
+
+
+def _sql_condition(op, column, threshold):
+
+    if op == ">=":
+        return column >= threshold
+    if op == "<=":
+        return column <= threshold
+    if op == "in":
+        return func.lower(column).in_(threshold)
+
+    raise ValueError(f"Unknown rule operator: {op}")
+
+
+# -----------------------------
+# PYTHON SCORER
+# -----------------------------
 def calculate_employability(worker):
     """
     Improved rule-based employability scoring.
@@ -9,57 +95,56 @@ def calculate_employability(worker):
     score = 0
     reasons = []
 
-    # ---- EXPERIENCE ----
-    if worker.experience_years >= 5:
-        score += 3
-        reasons.append("Strong experience (5+ years)")
-    elif worker.experience_years >= 2:
-        score += 2
-        reasons.append("Moderate experience (2+ years)")
-    else:
-        score += 1
-        reasons.append("Limited experience")
+    for field, tiers in EMPLOYABILITY_RULES:
+        value = getattr(worker, field)
 
-    # ---- SKILL DEMAND ----
-    if worker.skill.lower() in ["delivery", "cleaning", "driver"]:
-        score += 1
-        reasons.append("High-demand skill")
+        for op, threshold, points, reason in tiers:
+            if _matches(op, value, threshold):
+                score += points
+                reasons.append(reason)
+                break
 
-    # ---- PERFORMANCE METRICS ----
-    if worker.rating >= 4.5:
-        score += 2
-        reasons.append("Excellent rating")
-    elif worker.rating >= 3.5:
-        score += 1
-        reasons.append("Good rating")
+    # Clamp final score
+    score = max(MIN_SCORE, min(score, MAX_SCORE))
 
-    if worker.on_time >= 90:
-        score += 1
-        reasons.append("High punctuality")
+    return score, reasons
 
-    if worker.completion >= 90:
-        score += 1
-        reasons.append("High completion rate")
 
-    # ---- COMPLAINT PENALTY ----
-    if worker.complaints >= 20:
-        score -= 2
-        reasons.append("High complaint history")
-    elif worker.complaints >= 5:
-        score -= 1
-        reasons.append("Some complaints reported")
+# -----------------------------
+# SQL SCORER
+# -----------------------------
+def employability_score_expression(model):
+    """
+    SQL equivalent of calculate_employability for the given model,
+    so the database can score (and aggregate) workers without loading them.
 
-    # ---- JOB VOLUME ----
-    if worker.jobs_completed >= 100:
-        score += 1
-        reasons.append("Strong work history")
+    Returns the unclamped rule sum (range -1..10): clamping in SQL would
+    repeat the whole sum three times, so callers clamp with clamp_score.
+    """
 
-    # ---- SALARY FACTOR ----
-    if worker.salary <= 20000:
-        score += 1
-        reasons.append("Cost-effective salary")
+    score = 0
 
-    # Clamp final score
-    score = max(1, min(score, 10))
+    for field, tiers in EMPLOYABILITY_RULES:
+        column = getattr(model, field)
+
+        whens = [
+            (_sql_condition(op, column, threshold), points)
+            for op, threshold, points, _ in tiers
+            if op is not None
+        ]
+        fallback = next(
+            (points for op, _, points, _ in tiers if op is None),
+            0
+        )
+
+        score = score + case(*whens, else_=fallback)
+
+    return score
+
+
+def clamp_score(score):
+    """
+    Clamps raw rule sums (scalars or numpy arrays) to MIN_SCORE..MAX_SCORE.
+    """
 
-    return score, reasons
\ No newline at end of file
+    return np.clip(score, MIN_SCORE, MAX_SCORE)
@@ -1,21 +1,39 @@
-from fastapi import FastAPI, HTTPException, Depends
+import json
+from typing import List, Optional
+
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.schemas import WorkerCreate, WorkerResponse, WorkerScoreInput
+from app.schemas import WorkerCreate, WorkerResponse, WorkerScoreInput, SkillEnum
 from app.db import Base, engine, SessionLocal, WorkerDB
-from app.analytics import calculate_employability
-from app.ml_model import predict_worker
+from app.analytics import calculate_employability, clamp_score, employability_score_expression
+from app.ml_model import predict_worker, filter_workers, ml_histogram_shard
+from app.ml_model import prediction_batching_metrics
+from app.sharding import map_shards, shutdown_pools, start_pool
 from app.score_engine import calculate_final_score
+from app.agreement import (
+    AgreementSummary,
+    DEFAULT_TOP_N,
+    agreement_confidence,
+    build_agreement_report,
+    chunk_records,
+    iter_agreement_chunks
+)
 from fastapi.security import OAuth2PasswordRequestForm
 from app.auth import create_access_token, authenticate_admin
 from app.auth import verify_token
+from app.profiling import ProfilingMiddleware
+from app.rate_limit import RATE_LIMIT_STORAGE_URI  # registers the shmfile:// scheme
 from fastapi import Depends
 from app.ml_model import train_from_database
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import Request
 
 # ---------------- CONFIG ---------------- #
@@ -25,10 +43,24 @@ MAX_SALARY = 50000
 
 # ---------------- APP INIT ---------------- #
 
-app = FastAPI()
-limiter = Limiter(key_func=get_remote_address)# Apply rate limit to all routes
+@asynccontextmanager
+async def lifespan(app):
+    # Spawn the sharding pool (if SHARD_PROCESSES > 1) before serving
+    start_pool()
+    yield
+    shutdown_pools()
+
+
+app = FastAPI(lifespan=lifespan)
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=RATE_LIMIT_STORAGE_URI  # shmfile:// shares counters across workers
+)# Apply rate limit to all routes
 app.state.limiter = limiter
 
+# Added first so it sits inside CORS and profile responses keep CORS headers
+app.add_middleware(ProfilingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
@@ -131,14 +163,10 @@ def compare_rule_vs_ml(
 
     difference = round(ml_score - rule_score, 2)
 
-    jobs_factor = min(worker.jobs_completed / 50, 1)
-    agreement_score = max(0, 1 - (abs(difference) / 10))
+    confidence = float(
+        agreement_confidence(difference, worker.jobs_completed or 0)[0]
+    )
 
-    confidence = round(
-        0.5 * agreement_score +
-        0.5 * jobs_factor,
-        2
-)
     return {
         "worker_id": worker.id,
         "rule_score": rule_score,
@@ -156,22 +184,34 @@ def empty_distribution():
 
 
 @app.get("/analytics/distribution")
-def score_distribution(db: Session = Depends(get_db)):
+def score_distribution(
+    skill: Optional[List[SkillEnum]] = Query(default=None),
+    db: Session = Depends(get_db)
+):
 
-    workers = db.query(WorkerDB).all()
+    skills = [s.value for s in skill] if skill else None
 
     rule_dist = empty_distribution()
     ml_dist = empty_distribution()
 
-    for worker in workers:
-        rule_score, _ = calculate_employability(worker)
-        ml_score = predict_worker(worker)
+    # ----- RULE HISTOGRAM (computed by the database) -----
+    # Scored once in a subquery and grouped by the raw sum (-1..10);
+    # sums outside 1–10 are folded into the end buckets here
+    scores = filter_workers(
+        db.query(employability_score_expression(WorkerDB).label("rule_score")),
+        skills=skills
+    ).subquery()
 
-        rule_bucket = str(min(max(round(rule_score), 1), 10))
-        ml_bucket = str(min(max(round(ml_score), 1), 10))
+    rule_query = db.query(scores.c.rule_score, func.count()).group_by(scores.c.rule_score)
 
-        rule_dist[rule_bucket] += 1
-        ml_dist[ml_bucket] += 1
+    for bucket, count in rule_query:
+        rule_dist[str(int(clamp_score(bucket)))] += count
+
+    # ----- ML HISTOGRAM (batched predictions, sharded by id range) -----
+    counts = sum(map_shards(ml_histogram_shard, db, skills, skills=skills))
+
+    for bucket in range(1, 11):
+        ml_dist[str(bucket)] = int(counts[bucket])
 
     return {
         "rule_score_distribution": rule_dist,
@@ -179,6 +219,46 @@ def score_distribution(db: Session = Depends(get_db)):
     }
 
 
+# ---------------- FLEET RULE VS ML AGREEMENT ---------------- #
+
+def stream_agreement(worker_ids, top):
+
+    db = SessionLocal()
+
+    try:
+        summary = AgreementSummary(top)
+
+        for chunk in iter_agreement_chunks(db, worker_ids):
+            summary.add(chunk)
+
+            for record in chunk_records(chunk):
+                yield json.dumps(record) + "\n"
+
+        yield json.dumps({"summary": summary.result()}) + "\n"
+
+    finally:
+        db.close()
+
+
+@app.get("/analytics/agreement")
+def agreement_report(
+    worker_id: Optional[List[int]] = Query(default=None),
+    top: int = Query(default=DEFAULT_TOP_N, ge=0, le=1000),
+    stream: bool = False,
+    db: Session = Depends(get_db),
+    user=Depends(verify_token)
+):
+
+    # Streams outlive the handler, so the generator owns its own session
+    if stream:
+        return StreamingResponse(
+            stream_agreement(worker_id, top),
+            media_type="application/x-ndjson"
+        )
+
+    return build_agreement_report(db, worker_id, top)
+
+
 # ---------------- HYBRID FINAL SCORE ---------------- #
 
 @app.post("/score")
@@ -197,6 +277,13 @@ def score_worker(request: Request, worker: WorkerScoreInput):
     }
 
 
+# ---------------- PREDICTION BATCHING METRICS ---------------- #
+
+@app.get("/metrics/prediction-batching")
+def prediction_batching(user=Depends(verify_token)):
+    return prediction_batching_metrics()
+
+
 # ---------------- ADMIN RETRAIN ---------------- #
 
 @app.post("/retrain")
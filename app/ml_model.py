@@ -1,13 +1,37 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
 import joblib
 import numpy as np
 from sklearn.tree import DecisionTreeRegressor
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from app.db import SessionLocal, WorkerDB
-from app.analytics import calculate_employability
+from app.analytics import clamp_score, employability_score_expression
 
 MODEL_PATH = "employability_model.pkl"
 
+# WorkerDB columns needed to build the feature vector
+FEATURE_COLUMNS = [
+    "experience_years",
+    "skill",
+    "salary",
+    "rating",
+    "jobs_completed",
+    "complaints"
+]
+
+FLEET_CHUNK_SIZE = 5000
+
+# Micro-batching of concurrent single-worker predictions (0 µs disables)
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "32"))
+PREDICT_BATCH_MAX_WAIT_US = int(os.getenv("PREDICT_BATCH_MAX_WAIT_US", "0"))
+
 _model = None  # global cached model
 
 
@@ -29,6 +53,92 @@ def extract_features(worker):
         getattr(worker, "complaints", 0) or 0
     ]
 
+
+def extract_feature_matrix(workers):
+
+    return np.array(
+        [extract_features(worker) for worker in workers],
+        dtype=float
+    ).reshape(-1, len(FEATURE_COLUMNS))
+
+# -----------------------------
+# FLEET COLUMNS
+# -----------------------------
+def filter_workers(query, worker_ids=None, skills=None, id_range=None):
+    """
+    Applies the fleet filters shared by every fleet-wide query: explicit
+    worker ids, skills (lower-case values) and an inclusive (lo, hi) id range
+    (either end None for open).
+    """
+
+    if worker_ids:
+        query = query.where(WorkerDB.id.in_(worker_ids))
+
+    if skills:
+        query = query.where(func.lower(WorkerDB.skill).in_(skills))
+
+    if id_range is not None:
+        lo, hi = id_range
+
+        if lo is not None:
+            query = query.where(WorkerDB.id >= lo)
+        if hi is not None:
+            query = query.where(WorkerDB.id <= hi)
+
+    return query
+
+
+def fleet_query(
+    worker_ids=None,
+    skills=None,
+    id_range=None,
+    with_rule_score=True,
+    chunk_size=FLEET_CHUNK_SIZE
+):
+    """
+    Worker ids, feature columns and (optionally) SQL-computed raw rule sums
+    (clamp with clamp_score), ordered by id.
+    """
+
+    columns = [WorkerDB.id]
+
+    if with_rule_score:
+        columns.append(employability_score_expression(WorkerDB).label("rule_score"))
+
+    query = select(
+        *columns,
+        *[getattr(WorkerDB, column) for column in FEATURE_COLUMNS]
+    ).order_by(WorkerDB.id)
+
+    query = filter_workers(query, worker_ids, skills, id_range)
+
+    return query.execution_options(yield_per=chunk_size)
+
+
+def load_fleet_columns(db, worker_ids=None, skills=None):
+    """
+    Loads the fleet as column arrays: (ids, rule_scores, feature_matrix).
+    """
+
+    ids = []
+    rule_scores = []
+    features = []
+
+    for rows in db.execute(fleet_query(worker_ids, skills)).partitions():
+        ids.append(np.array([row.id for row in rows], dtype=np.int64))
+        rule_scores.append(clamp_score(np.array([row.rule_score for row in rows], dtype=float)))
+        features.append(extract_feature_matrix(rows))
+
+    if not ids:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty(0),
+            np.empty((0, len(FEATURE_COLUMNS)))
+        )
+
+    return np.concatenate(ids), np.concatenate(rule_scores), np.concatenate(features)
+
+
 # -----------------------------
 # TRAIN MODEL
 # -----------------------------
@@ -37,30 +147,18 @@ def train_from_database():
     db: Session = SessionLocal()
 
     try:
-        workers = db.query(WorkerDB).all()
+        # Rule scores come straight from SQL as pseudo-labels
+        _, y, X = load_fleet_columns(db)
 
-        if len(workers) < 5:
+        if len(y) < 5:
             raise Exception("Not enough data to train model")
 
-        X = []
-        y = []
-
-        for worker in workers:
-            features = extract_features(worker)
-            score, _ = calculate_employability(worker)
-
-            X.append(features)
-            y.append(score)
-
-        X = np.array(X)
-        y = np.array(y)
-
         model = DecisionTreeRegressor(max_depth=4)
         model.fit(X, y)
 
         joblib.dump(model, MODEL_PATH)
 
-        print(f"Model retrained using {len(workers)} workers")
+        print(f"Model retrained using {len(y)} workers")
 
     finally:
         db.close()
@@ -83,11 +181,12 @@ def load_model():
 # -----------------------------
 def predict_worker(worker):
 
-    model = load_model()
-
-    features = np.array([extract_features(worker)])
+    features = extract_features(worker)
 
-    raw_score = model.predict(features)[0]
+    if _batcher is not None:
+        raw_score = _batcher.predict(features)
+    else:
+        raw_score = load_model().predict(np.array([features]))[0]
 
     # clamp score
     raw_score = min(max(raw_score, 1), 10)
@@ -101,4 +200,210 @@ def predict_worker(worker):
     return {
         "predicted_quality": predicted_quality,
         "confidence": confidence
-    }
\ No newline at end of file
+    }
+
+
+# -----------------------------
+# BATCH PREDICTION
+# -----------------------------
+def predict_matrix(features, model=None):
+    """
+    Vectorized prediction over a feature matrix (rows from
+    extract_feature_matrix). Returns (predicted_quality, confidence).
+    """
+
+    if len(features) == 0:
+        return np.empty(0), np.empty(0)
+
+    if model is None:
+        model = load_model()
+
+    raw_scores = np.clip(model.predict(features), 1, 10)
+
+    predicted_quality = raw_scores / 10
+
+    jobs_completed = features[:, FEATURE_COLUMNS.index("jobs_completed")]
+    confidence = np.minimum(jobs_completed / 50, 1)
+
+    return predicted_quality, confidence
+
+
+def predict_workers(workers, model=None):
+    """
+    Vectorized predict_worker: one model.predict call for many workers.
+    Returns (predicted_quality, confidence) arrays aligned with workers.
+    """
+
+    return predict_matrix(extract_feature_matrix(list(workers)), model)
+
+
+# -----------------------------
+# ML SCORE HISTOGRAM
+# -----------------------------
+def ml_score_histogram(predicted_quality):
+    """
+    Counts per ML score bucket: index b holds workers whose 1–10 ML score
+    rounds to b (index 0 is always empty).
+    """
+
+    buckets = np.clip(np.rint(predicted_quality * 10), 1, 10).astype(int)
+
+    return np.bincount(buckets, minlength=11)
+
+
+def ml_histogram(db, skills=None, id_range=None, model=None):
+
+    counts = np.zeros(11, dtype=int)
+
+    query = fleet_query(skills=skills, id_range=id_range, with_rule_score=False)
+
+    for rows in db.execute(query).partitions():
+        predicted_quality, _ = predict_workers(rows, model)
+        counts += ml_score_histogram(predicted_quality)
+
+    return counts
+
+
+def ml_histogram_shard(model, id_range, skills=None):
+    """
+    Shard task (see app.sharding.map_shards): fetches, featurizes and
+    predicts one id range in the worker process.
+    """
+
+    db = SessionLocal()
+
+    try:
+        return ml_histogram(db, skills, id_range, model)
+    finally:
+        db.close()
+
+
+# -----------------------------
+# MICRO-BATCHING
+# -----------------------------
+class PredictionBatcher:
+    """
+    Coalesces concurrent single-row predictions: the first request opens a
+    window of max_wait_us, and everything queued by then (up to
+    max_batch_size rows) goes through one model.predict call.
+    """
+
+    def __init__(self, max_batch_size, max_wait_us):
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait_us / 1_000_000
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._metrics_lock = threading.Lock()
+        self._batches = 0
+        self._predictions = 0
+        self._batch_sizes = Counter()
+        self._total_queue_delay = 0.0
+        self._max_queue_delay = 0.0
+        self._total_predict_time = 0.0
+
+    def predict(self, features):
+
+        self._ensure_started()
+
+        future = Future()
+        self._queue.put((features, time.perf_counter(), future))
+
+        return future.result()
+
+    def _ensure_started(self):
+
+        if self._thread is not None:
+            return
+
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="prediction-batcher",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][1] + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+
+        started = time.perf_counter()
+
+        try:
+            raw_scores = load_model().predict(
+                np.array([features for features, _, _ in batch])
+            )
+        except Exception as exc:
+            for _, _, future in batch:
+                future.set_exception(exc)
+            return
+
+        for (_, _, future), raw_score in zip(batch, raw_scores):
+            future.set_result(raw_score)
+
+        finished = time.perf_counter()
+        queue_delays = [started - enqueued for _, enqueued, _ in batch]
+
+        with self._metrics_lock:
+            self._batches += 1
+            self._predictions += len(batch)
+            self._batch_sizes[len(batch)] += 1
+            self._total_queue_delay += sum(queue_delays)
+            self._max_queue_delay = max(self._max_queue_delay, max(queue_delays))
+            self._total_predict_time += finished - started
+
+    def metrics(self):
+
+        with self._metrics_lock:
+            batches = max(self._batches, 1)
+            predictions = max(self._predictions, 1)
+
+            return {
+                "enabled": True,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_us": round(self.max_wait * 1_000_000),
+                "batches": self._batches,
+                "predictions": self._predictions,
+                "mean_batch_size": round(self._predictions / batches, 2),
+                "batch_size_histogram": {
+                    str(size): count for size, count in sorted(self._batch_sizes.items())
+                },
+                "mean_queue_delay_us": round(self._total_queue_delay / predictions * 1_000_000, 1),
+                "max_queue_delay_us": round(self._max_queue_delay * 1_000_000, 1),
+                "mean_predict_time_us": round(self._total_predict_time / batches * 1_000_000, 1)
+            }
+
+
+_batcher = (
+    PredictionBatcher(PREDICT_BATCH_MAX_SIZE, PREDICT_BATCH_MAX_WAIT_US)
+    if PREDICT_BATCH_MAX_WAIT_US > 0 else None
+)
+
+
+def prediction_batching_metrics():
+
+    if _batcher is None:
+        return {"enabled": False}
+
+    return _batcher.metrics()
@@ -0,0 +1,313 @@
+# app/profiling.py
+
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+import anyio.to_thread
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.security.utils import get_authorization_scheme_param
+
+from app.auth import verify_token
+
+# ---------------- CONFIG ---------------- #
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAM = "profile"
+
+# "pstats": deterministic cProfile, returned as sorted pstats text
+# "collapsed": sampling profiler, returned as collapsed stacks (flamegraph input)
+PROFILE_MODES = ("pstats", "collapsed")
+
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.0001"))
+PSTATS_LIMIT = 50
+
+# When set, profiles are written here and the normal response is returned
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+
+_active_profile = ContextVar("active_profile", default=None)
+_profiling = False
+
+
+# -----------------------------
+# PROFILERS
+# -----------------------------
+class StackSampler:
+    """
+    Samples the threadpool threads currently running the request's work on
+    a background thread and counts the collapsed (root;...;leaf) stacks.
+    """
+
+    def __init__(self, profile, interval=SAMPLE_INTERVAL):
+        self.profile = profile
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+
+            for thread_id in list(self.profile.worker_threads):
+                frame = frames.get(thread_id)
+
+                if frame is None:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+
+        if not self.stacks:
+            return (
+                f"# no samples: the request's threadpool work finished within "
+                f"one {self.interval * 1_000_000:.0f}us sampling interval (or it "
+                f"had none); use profile=pstats or lower PROFILE_SAMPLE_INTERVAL\n"
+            )
+
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        )
+
+
+class RequestProfile:
+    """
+    Profile of every threadpool call made on a request's behalf (sync
+    dependencies, the endpoint, response serialization and streamed body
+    iteration). The shared event loop thread is left out: it also runs
+    every other request's async work and idles in the selector.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.worker_threads = set()
+        self.profilers = []
+        self.sampler = StackSampler(self) if mode == "collapsed" else None
+
+    def start(self):
+
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def stop(self):
+
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def wrap(self, func):
+        """
+        Wraps a threadpool call so it is profiled on the worker thread.
+        """
+
+        def run(*args):
+
+            if self.sampler is not None:
+                thread_id = threading.get_ident()
+                self.worker_threads.add(thread_id)
+                try:
+                    return func(*args)
+                finally:
+                    self.worker_threads.discard(thread_id)
+
+            profiler = cProfile.Profile()
+            self.profilers.append(profiler)
+
+            profiler.enable()
+            try:
+                return func(*args)
+            finally:
+                profiler.disable()
+
+        return run
+
+    def stats(self, stream=None):
+
+        stats = pstats.Stats(self.profilers[0], stream=stream)
+
+        for profiler in self.profilers[1:]:
+            stats.add(profiler)
+
+        return stats
+
+    def render(self):
+
+        if self.sampler is not None:
+            return self.sampler.collapsed()
+
+        if not self.profilers:
+            return "# no threadpool calls: the request ran only async code\n"
+
+        out = io.StringIO()
+        self.stats(out).sort_stats("cumulative").print_stats(PSTATS_LIMIT)
+        return out.getvalue()
+
+    def save(self, directory):
+
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+
+        if self.sampler is None and self.profilers:
+            path = os.path.join(directory, f"{stamp}-{id(self)}.pstats")
+            self.stats().dump_stats(path)
+        else:
+            suffix = "collapsed" if self.sampler is not None else "txt"
+            path = os.path.join(directory, f"{stamp}-{id(self)}.{suffix}")
+            with open(path, "w") as f:
+                f.write(self.render())
+
+        return path
+
+
+# -----------------------------
+# THREADPOOL HOOK
+# -----------------------------
+# Starlette and FastAPI send sync dependencies, endpoints and streamed
+# bodies through anyio.to_thread.run_sync (looked up on every call), which
+# runs them in a copy of the caller's context. The hook is installed once
+# at import and only wraps calls made while a profile is active.
+
+def _install_run_sync_hook():
+
+    original = anyio.to_thread.run_sync
+
+    if getattr(original, "profiling_hook", False):
+        return
+
+    @functools.wraps(original)
+    async def run_sync(func, *args, **kwargs):
+
+        profile = _active_profile.get()
+
+        if profile is not None:
+            func = profile.wrap(func)
+
+        return await original(func, *args, **kwargs)
+
+    run_sync.profiling_hook = True
+    anyio.to_thread.run_sync = run_sync
+
+
+_install_run_sync_hook()
+
+
+# -----------------------------
+# MIDDLEWARE
+# -----------------------------
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware: requests without the profile header/query
+    parameter are passed straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+
+        global _profiling
+
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+
+        mode = (
+            request.headers.get(PROFILE_HEADER) or
+            request.query_params.get(PROFILE_QUERY_PARAM)
+        )
+
+        if not mode:
+            return await self.app(scope, receive, send)
+
+        error = self.check_access(request, mode)
+
+        if error is not None:
+            return await error(scope, receive, send)
+
+        # One profiled request at a time: profilers are per thread
+        if _profiling:
+            return await JSONResponse(
+                status_code=409,
+                content={"detail": "Another request is being profiled"}
+            )(scope, receive, send)
+
+        profile = RequestProfile(mode)
+        messages = []
+
+        async def capture(message):
+            messages.append(message)
+
+        _profiling = True
+        reset = _active_profile.set(profile)
+
+        profile.start()
+        try:
+            # the whole app call, including a streamed body
+            await self.app(scope, receive, capture)
+        finally:
+            profile.stop()
+            _active_profile.reset(reset)
+            _profiling = False
+
+        start = messages[0]
+
+        if PROFILE_DIR:
+            start["headers"] = list(start.get("headers", [])) + [
+                (b"x-profile-file", profile.save(PROFILE_DIR).encode())
+            ]
+            for message in messages:
+                await send(message)
+            return
+
+        response = PlainTextResponse(
+            profile.render(),
+            headers={"X-Profile-Status": str(start["status"])}
+        )
+        await response(scope, receive, send)
+
+    def check_access(self, request, mode):
+
+        # 👑 Admin only
+        _, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+
+        if not token:
+            return JSONResponse(status_code=401, content={"detail": "Not authenticated"})
+
+        try:
+            user = verify_token(token)
+        except HTTPException as exc:
+            return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+        if user.get("role") != "admin":
+            return JSONResponse(status_code=403, content={"detail": "Not authorized"})
+
+        if mode not in PROFILE_MODES:
+            return JSONResponse(
+                status_code=400,
+                content={"detail": f"Profile mode must be one of {', '.join(PROFILE_MODES)}"}
+            )
+
+        return None
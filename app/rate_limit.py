@@ -0,0 +1,315 @@
+# app/rate_limit.py
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import weakref
+from urllib.parse import parse_qs, urlparse
+
+from limits.storage import Storage
+
+# ---------------- CONFIG ---------------- #
+
+# e.g. "shmfile:///dev/shm/marathon-ratelimit?slots=65536"
+# (default "memory://" keeps slowapi's per-process counters)
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+
+DEFAULT_PATH = "/dev/shm/marathon-ratelimit"
+DEFAULT_SLOTS = 65536
+
+# Linear probing never looks further than this from a key's home slot;
+# the table has PROBE_LIMIT spare slots at the end so windows never wrap
+PROBE_LIMIT = 32
+
+# incr() result when a key's probe window is full of live counters: above
+# any limit, so the hit is rejected rather than evicting another client
+TABLE_FULL_COUNT = sys.maxsize
+
+FULL_WARNING_INTERVAL = 60
+
+# Limiter keys are few (client x limit); hashing one costs more than a lookup
+HASH_CACHE_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+# slot: key hash (0 = empty), counter, expiry timestamp
+SLOT = struct.Struct("<Qqd")
+
+_hashes = {}
+
+# Live storages, so a forked child can drop the descriptors it inherited
+_storages = weakref.WeakSet()
+
+
+def key_hash(key):
+    """
+    Stable across processes (unlike hash()); 0 is reserved for empty slots.
+    """
+
+    hashed = _hashes.get(key)
+
+    if hashed is None:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "little") or 1
+
+        if len(_hashes) >= HASH_CACHE_SIZE:
+            _hashes.clear()
+        _hashes[key] = hashed
+
+    return hashed
+
+
+def _after_fork_in_child():
+    for storage in list(_storages):
+        storage._forget_descriptors()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _LockFile:
+    """
+    One thread's descriptor of the table file, closed when the thread's
+    locals are dropped (threadpool threads come and go).
+    """
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR)
+        self.close = weakref.finalize(self, os.close, self.fd)
+
+
+class SharedFileStorage(Storage):
+    """
+    Fixed-window rate limit counters in a memory-mapped file, shared by
+    every worker process on the host.
+
+    The file is a fixed-size open-addressed hash table, so each update
+    touches at most PROBE_LIMIT slots under one flock. flock locks belong
+    to an open file description, so every thread opens its own descriptor
+    (and a forked child reopens them): one lock then excludes both other
+    threads and other processes. Expired slots are reused in place. Live
+    counters are never evicted: if a key's probe window is all live, the
+    hit is rejected and a warning logged (size the table up).
+    """
+
+    STORAGE_SCHEME = ["shmfile"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+
+        parsed = urlparse(uri or "")
+        params = parse_qs(parsed.query)
+
+        self.path = parsed.path or DEFAULT_PATH
+        self.slots = int(params.get("slots", [DEFAULT_SLOTS])[0])
+
+        size = (self.slots + PROBE_LIMIT) * SLOT.size
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        # Grow (never shrink) under the lock so concurrent starts agree
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+
+                # MAP_SHARED: the mapping stays valid and shared after fork.
+                # mmap keeps a dup of fd, so unlock explicitly below.
+                self._map = mmap.mmap(fd, size)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+        self._local = threading.local()
+        self._lock_files = weakref.WeakSet()
+        self._last_full_warning = 0.0
+
+        _storages.add(self)
+
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    # -----------------------------
+    # LOCKING
+    # -----------------------------
+    def _forget_descriptors(self):
+
+        # Inherited descriptors share the parent's locks: close them
+        for lock_file in list(self._lock_files):
+            lock_file.close()
+
+        self._local = threading.local()
+        self._lock_files = weakref.WeakSet()
+
+    def _acquire(self):
+
+        lock_file = getattr(self._local, "lock_file", None)
+
+        if lock_file is None:
+            lock_file = self._local.lock_file = _LockFile(self.path)
+            self._lock_files.add(lock_file)
+
+        fcntl.flock(lock_file.fd, fcntl.LOCK_EX)
+
+        return lock_file.fd
+
+    def _release(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+    # -----------------------------
+    # SLOT LOOKUP (caller holds the lock)
+    # -----------------------------
+    def _find(self, hashed, now, insert):
+        """
+        Returns (offset, count, expiry) for the key's live slot, or a free
+        or expired slot to claim for it when insert is set (count 0), or
+        None. Inserts always take the first such slot, so a key never sits
+        past an empty slot and the scan can stop there.
+        """
+
+        start = (hashed % self.slots) * SLOT.size
+        candidate = None
+
+        for offset in range(start, start + PROBE_LIMIT * SLOT.size, SLOT.size):
+            slot_hash, count, expiry = SLOT.unpack_from(self._map, offset)
+
+            if slot_hash == hashed and expiry > now:
+                return offset, count, expiry
+
+            if candidate is None and (slot_hash == 0 or expiry <= now):
+                candidate = offset
+
+            if slot_hash == 0:
+                break
+
+        if not insert or candidate is None:
+            return None
+
+        return candidate, 0, now
+
+    def _table_full(self, now):
+
+        if now - self._last_full_warning >= FULL_WARNING_INTERVAL:
+            self._last_full_warning = now
+            logger.warning(
+                "Rate limit table %s is full around a key's slot; rejecting "
+                "new keys until counters expire (raise ?slots=, now %d)",
+                self.path,
+                self.slots
+            )
+
+    # -----------------------------
+    # STORAGE API
+    # -----------------------------
+    def incr(self, key, expiry, amount=1):
+
+        hashed = key_hash(key)
+        now = time.time()
+
+        fd = self._acquire()
+        try:
+            found = self._find(hashed, now, insert=True)
+
+            if found is None:
+                self._table_full(now)
+                return TABLE_FULL_COUNT
+
+            offset, count, key_expiry = found
+
+            if count == 0:
+                key_expiry = now + expiry
+
+            count += amount
+            SLOT.pack_into(self._map, offset, hashed, count, key_expiry)
+
+            return count
+        finally:
+            self._release(fd)
+
+    def decr(self, key, amount=1):
+
+        hashed = key_hash(key)
+
+        fd = self._acquire()
+        try:
+            found = self._find(hashed, time.time(), insert=False)
+
+            if found is None:
+                return 0
+
+            offset, count, key_expiry = found
+            count = max(count - amount, 0)
+            SLOT.pack_into(self._map, offset, hashed, count, key_expiry)
+
+            return count
+        finally:
+            self._release(fd)
+
+    def get(self, key):
+
+        hashed = key_hash(key)
+
+        fd = self._acquire()
+        try:
+            found = self._find(hashed, time.time(), insert=False)
+            return found[1] if found else 0
+        finally:
+            self._release(fd)
+
+    def get_expiry(self, key):
+
+        hashed = key_hash(key)
+        now = time.time()
+
+        fd = self._acquire()
+        try:
+            found = self._find(hashed, now, insert=False)
+            return found[2] if found else now
+        finally:
+            self._release(fd)
+
+    def clear(self, key):
+
+        hashed = key_hash(key)
+
+        fd = self._acquire()
+        try:
+            found = self._find(hashed, time.time(), insert=False)
+
+            # expire rather than empty the slot, keeping later keys reachable
+            if found is not None:
+                SLOT.pack_into(self._map, found[0], hashed, 0, 0.0)
+        finally:
+            self._release(fd)
+
+    def reset(self):
+
+        fd = self._acquire()
+        try:
+            now = time.time()
+            live = 0
+
+            for slot in range(self.slots + PROBE_LIMIT):
+                slot_hash, _, expiry = SLOT.unpack_from(self._map, slot * SLOT.size)
+                if slot_hash and expiry > now:
+                    live += 1
+
+            self._map[:] = bytes(len(self._map))
+
+            return live
+        finally:
+            self._release(fd)
+
+    def check(self):
+        return not self._map.closed
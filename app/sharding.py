@@ -0,0 +1,160 @@
+# app/sharding.py
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.db import WorkerDB
+from app.ml_model import MODEL_PATH, filter_workers, load_model
+
+# ---------------- CONFIG ---------------- #
+
+# 0 or 1 keeps fleet-wide jobs in-process
+SHARD_PROCESSES = int(os.getenv("SHARD_PROCESSES", "0"))
+
+# Fleets smaller than this are not worth the fan-out
+MIN_SHARD_SIZE = 10000
+
+# Process pools keyed by size: only created under _lock and shut down at
+# exit, so a request never sees a pool shut down under it
+_lock = threading.Lock()
+_pools = {}
+
+
+# -----------------------------
+# PROCESS POOL
+# -----------------------------
+def _init_worker():
+
+    # Each worker loads its own copy of the model once, at spawn (it is
+    # not shared memory); tasks then use the cached load_model()
+    if os.path.exists(MODEL_PATH):
+        load_model()
+
+
+def get_pool(processes):
+
+    with _lock:
+        pool = _pools.get(processes)
+
+        if pool is None:
+            # spawn: the API process is threaded, forking it is unsafe
+            pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+            _pools[processes] = pool
+
+        return pool
+
+
+def _ready():
+    return os.getpid()
+
+
+def start_pool(processes=None):
+    """
+    Creates the pool and waits for every worker process to come up, so
+    the spawn cost is paid at startup rather than inside a request.
+    """
+
+    processes = processes or SHARD_PROCESSES
+
+    if processes <= 1:
+        return
+
+    pool = get_pool(processes)
+
+    for future in [pool.submit(_ready) for _ in range(processes)]:
+        future.result()
+
+
+@atexit.register
+def shutdown_pools():
+
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+
+
+# -----------------------------
+# ID RANGES
+# -----------------------------
+def shard_ranges(db, count, shards, worker_ids=None, skills=None):
+    """
+    Splits the id space into contiguous, inclusive (lo, hi) id ranges that
+    each hold a similar share of the count filtered workers. The first
+    range is open below and the last open above (None), and each range
+    starts right after the previous one ends, so together they cover every
+    id whatever filters a task applies; the filters only balance the shards.
+    All boundary ids come from one row_number() query.
+    """
+
+    edges = np.unique(np.linspace(0, count, shards + 1).astype(int)[1:-1])
+
+    numbered = filter_workers(
+        select(
+            WorkerDB.id,
+            func.row_number().over(order_by=WorkerDB.id).label("row")
+        ),
+        worker_ids,
+        skills
+    ).subquery()
+
+    # first id of every shard after the first (row numbers are 1-based)
+    starts = db.scalars(
+        select(numbered.c.id)
+        .where(numbered.c.row.in_([int(edge) + 1 for edge in edges]))
+        .order_by(numbered.c.id)
+    ).all()
+
+    bounds = [None, *starts, None]
+
+    return [
+        (lo, None if hi is None else hi - 1)
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
+
+
+# -----------------------------
+# SHARDED EXECUTION
+# -----------------------------
+def _run_shard(task, id_range, args):
+    return task(load_model(), id_range, *args)
+
+
+def map_shards(task, db, *args, worker_ids=None, skills=None, processes=None):
+    """
+    Runs task(model, id_range, *args) for each id range of the fleet across
+    the process pool and returns the results in id order. Each task does its
+    own fetch, featurization and prediction; only its result comes back.
+    The ranges cover every id, so the task's own filters decide its rows;
+    worker_ids / skills only size and balance the shards.
+    Small fleets (or processes <= 1) run as one in-process task over all ids.
+    """
+
+    processes = processes or SHARD_PROCESSES
+
+    if processes <= 1:
+        return [task(load_model(), None, *args)]
+
+    count = db.scalar(filter_workers(select(func.count(WorkerDB.id)), worker_ids, skills))
+
+    if count < MIN_SHARD_SIZE:
+        return [task(load_model(), None, *args)]
+
+    pool = get_pool(processes)
+
+    futures = [
+        pool.submit(_run_shard, task, id_range, args)
+        for id_range in shard_ranges(db, count, processes, worker_ids, skills)
+    ]
+
+    return [future.result() for future in futures]
@@ -0,0 +1,186 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from app.rate_limit import PROBE_LIMIT, TABLE_FULL_COUNT
+
+# Single-box checks for the shmfile:// rate limit storage:
+#   python rate_limit_check.py [--processes 4] [--increments 5000]
+# Exits non-zero if any check fails.
+
+
+def storage_uri(path, slots):
+    return f"shmfile://{path}?slots={slots}"
+
+
+def hammer(uri, increments):
+    hammer_storage(storage_from_string(uri), increments)
+
+
+def hammer_storage(storage, increments):
+
+    for _ in range(increments):
+        storage.incr("shared-key", 60)
+
+
+def per_call_us(storage, calls=100000):
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        storage.incr("timing", 60)
+
+    return (time.perf_counter() - started) / calls * 1_000_000
+
+
+def check(name, ok, detail=""):
+
+    print(f"{'ok  ' if ok else 'FAIL'} {name} {detail}")
+
+    return ok
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check the shared rate limit storage")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--increments", type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    path = os.path.join(directory, f"marathon-ratelimit-check-{os.getpid()}")
+    results = []
+
+    try:
+        # ---- counters are shared and exact across processes ----
+        uri = storage_uri(path, 1024)
+        storage = storage_from_string(uri)
+        storage.reset()
+
+        workers = [
+            multiprocessing.Process(target=hammer, args=(uri, args.increments))
+            for _ in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        expected = args.processes * args.increments
+        results.append(check(
+            "shared count",
+            storage.get("shared-key") == expected,
+            f"{storage.get('shared-key')} / {expected}"
+        ))
+
+        # ---- threads of one process share the storage object ----
+        storage.reset()
+        threads = [
+            threading.Thread(target=hammer_storage, args=(storage, args.increments))
+            for _ in range(args.processes)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        results.append(check(
+            "threads",
+            storage.get("shared-key") == expected,
+            f"{storage.get('shared-key')} / {expected}"
+        ))
+
+        # ---- children forked after the storage was opened (--preload) ----
+        if "fork" in multiprocessing.get_all_start_methods():
+            storage.reset()
+            storage.incr("shared-key", 60)
+            storage.clear("shared-key")
+
+            fork = multiprocessing.get_context("fork")
+            workers = [
+                fork.Process(target=hammer_storage, args=(storage, args.increments))
+                for _ in range(args.processes)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+            results.append(check(
+                "forked after open",
+                storage.get("shared-key") == expected,
+                f"{storage.get('shared-key')} / {expected}"
+            ))
+
+        # ---- descriptors of finished threads are closed ----
+        before = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+        for _ in range(50):
+            thread = threading.Thread(target=storage.incr, args=("per-thread", 60))
+            thread.start()
+            thread.join()
+
+        if before is not None:
+            after = len(os.listdir("/proc/self/fd"))
+            results.append(check("thread descriptors closed", after <= before + 1, f"{before} -> {after} fds"))
+
+        # ---- expired counters are reset and their slot reused ----
+        storage.incr("short-lived", 1)
+        time.sleep(1.1)
+        results.append(check(
+            "expiry",
+            storage.get("short-lived") == 0 and storage.incr("short-lived", 1) == 1
+        ))
+
+        # ---- a full table rejects new keys instead of evicting live ones ----
+        os.remove(path)
+        small = storage_from_string(storage_uri(path, 4))
+        capacity = 4 + PROBE_LIMIT
+
+        counts = [small.incr(f"client-{i}", 60) for i in range(capacity * 2)]
+        admitted = [i for i, count in enumerate(counts) if count == 1]
+        rejected = [i for i, count in enumerate(counts) if count == TABLE_FULL_COUNT]
+
+        results.append(check(
+            "no eviction",
+            len(admitted) + len(rejected) == len(counts) and
+            all(small.get(f"client-{i}") == 1 for i in admitted),
+            f"{len(admitted)} admitted, {len(rejected)} rejected"
+        ))
+
+        # ---- cleared keys leave later keys in the same window reachable ----
+        small.clear(f"client-{admitted[0]}")
+        results.append(check(
+            "clear keeps neighbours",
+            all(small.get(f"client-{i}") == 1 for i in admitted[1:])
+        ))
+
+        # ---- slowapi's fixed-window strategy enforces limits ----
+        os.remove(path)
+        storage = storage_from_string(storage_uri(path, 1024))
+        limiter = FixedWindowRateLimiter(storage)
+        limit = parse("10/minute")
+        allowed = sum(limiter.hit(limit, "127.0.0.1") for _ in range(15))
+        results.append(check("10/minute", allowed == 10, f"{allowed} allowed"))
+
+        # ---- per-call cost, against slowapi's per-process default ----
+        print(
+            f"     incr {per_call_us(storage):.2f} us/call "
+            f"(memory:// {per_call_us(storage_from_string('memory://')):.2f} us/call)"
+        )
+
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()